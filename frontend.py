@@ -62,7 +62,9 @@ def main():
         st.subheader("NER Graph Visualization")
         ner_graph = risk_model_output.get("ner_graph")
         if ner_graph is not None:
-            ner_graph_plot = risk_engine.visualise_graph(ner_graph)
+            ner_graph_plot = risk_engine.visualise_graph(
+                ner_graph, layout=risk_model_output.get("ner_graph_layout")
+            )
             st.pyplot(ner_graph_plot)
 
         # Visualize the Temporal Clustering
@@ -1,6 +1,6 @@
 import json
 from datetime import datetime
-from typing import List
+from typing import Dict, List, Optional, Union
 
 import matplotlib.pyplot as plt
 import networkx as nx
@@ -10,7 +10,7 @@ from matplotlib.dates import date2num
 from sklearn.cluster import DBSCAN
 
 from .modelling.llm_wrapper import ChatGPTWrapper
-from .modelling.ner_graph import NerNetworkModel
+from .modelling.ner_graph import NerGraph, NerNetworkModel
 from .modelling.temporal import TemporalModel
 from .modelling.topic_models import TopicModel
 
@@ -21,11 +21,14 @@ class RiskEngineBase:
         self.topic_model = TopicModel()
         self.llm_wrapper = ChatGPTWrapper()
         self.ner_model = NerNetworkModel()
+        self._layout_cache: Dict[str, dict] = {}
 
     @staticmethod
     def _parse_company_data(data: dict) -> pd.DataFrame:
         df = pd.DataFrame(data["SearchResults"])
         df.columns = df.columns.str.lower()
+        # Keep the position in SearchResults so rows can be traced back after filtering
+        df["article_id"] = df.index
         df["full_text"] = df.title + df.snippet
         df = df.drop_duplicates(subset="full_text")
         return df
@@ -47,12 +50,30 @@ class RiskEngineBase:
             df = df.drop("document", axis=1)
 
         if kwargs.get("ner_graph", True):
-            output_schema["ner_graph"] = self.ner_model.extract_verb_triplets(
+            ner_graph = self.ner_model.extract_graph(
                 text=df["full_text"],
                 entity_types=["PERSON", "NORP", "FAC", "ORG", "EVENT", "LAW"],
+                top_k=kwargs.get("ner_top_k", None),
+                article_ids=df["article_id"].tolist(),
+            )
+            output_schema["ner_graph"] = ner_graph.to_dict()
+            output_schema["ner_graph_layout"] = self.compute_layout(
+                ner_graph=ner_graph,
+                max_edges=kwargs.get("layout_max_edges", 200),
             )
 
         output_schema["topics"] = []
+        pack_prompts = kwargs.get("use_gpt", True) and kwargs.get("pack_prompts", True)
+        if pack_prompts:
+            gpt_descriptions = self.llm_wrapper.predict_packed(
+                topic_titles={
+                    topic: df[df.topic == topic]["representative_docs"].tolist()[0]
+                    for topic in df.topic.unique()
+                    if topic != -1
+                },
+                max_prompt_tokens=kwargs.get("max_prompt_tokens", 2048),
+            )
+
         for topic in df.topic.unique():
             if topic != -1:
                 filtered_df = df[df.topic == topic]
@@ -62,7 +83,10 @@ class RiskEngineBase:
                     "extracted_keywords": filtered_df["top_n_words"].tolist()[0],
                 }
 
-                if kwargs.get("use_gpt", True):
+                if pack_prompts:
+                    if gpt_descriptions.get(topic) is not None:
+                        topic_dict["theme"] = gpt_descriptions[topic]
+                elif kwargs.get("use_gpt", True):
                     gpt_description = self.llm_wrapper.predict(
                         titles=filtered_df["representative_docs"].tolist(),
                         articles=None,
@@ -79,22 +103,128 @@ class RiskEngineBase:
 
         return output_schema
 
-    def visualise_graph(self, triplets: List[List[str]]):
-        graph = nx.DiGraph()
-        for subject, relation, object_ in triplets:
-            graph.add_edge(subject, object_, label=relation)
+    def compute_layout(
+        self,
+        ner_graph: Union[NerGraph, dict, List[List[str]]],
+        max_edges: int = 200,
+        layout: str = "auto",
+    ) -> dict:
+        """
+        Compute, or fetch from the cache, the positions of the top-weighted subgraph.
+
+        Args:
+            ner_graph (Union[NerGraph, dict, list]): A NerGraph, its serialised form, or a list of triplets.
+            max_edges (int): Number of heaviest edges to keep before laying out. Default is 200.
+            layout (str): One of "spring", "components" or "auto", which uses the faster components layout when the graph had to be pruned to max_edges. Default is "auto".
+
+        Returns:
+            dict: Serialised layout with the graph hash, the layout used, and the nodes with their positions.
+        """
+        assert layout in ["spring", "components", "auto"], "Unsupported graph layout."
+        full_graph = self._load_ner_graph(ner_graph)
+        graph = full_graph.top_k(max_edges)
+        if layout == "auto":
+            layout = "components" if len(full_graph) > max_edges else "spring"
+        graph_hash = graph.graph_hash()
+        cache_key = f"{graph_hash}-{layout}"
+
+        if cache_key not in self._layout_cache:
+            positions = self._layout_positions(graph.to_networkx(), layout=layout)
 
-        plt.figure(figsize=(18, 12))
-        pos = nx.spring_layout(graph)
-        nx.draw_networkx_nodes(graph, pos, node_size=500, node_color="lightblue")
-        nx.draw_networkx_edges(graph, pos, arrows=True, edge_color="gray")
-        nx.draw_networkx_labels(graph, pos, font_size=12, font_color="black")
-        edge_labels = nx.get_edge_attributes(graph, "label")
-        nx.draw_networkx_edge_labels(graph, pos, edge_labels=edge_labels)
+            # Drop the oldest layout so the cache stays bounded
+            if len(self._layout_cache) >= 32:
+                self._layout_cache.pop(next(iter(self._layout_cache)))
+            self._layout_cache[cache_key] = {
+                "graph_hash": graph_hash,
+                "layout": layout,
+                "nodes": list(positions.keys()),
+                "positions": [
+                    [round(float(x), 4), round(float(y), 4)]
+                    for x, y in positions.values()
+                ],
+            }
+
+        return self._layout_cache[cache_key]
+
+    @staticmethod
+    def _layout_positions(graph: nx.DiGraph, layout: str) -> Dict[str, np.ndarray]:
+        if layout == "spring":
+            return nx.spring_layout(graph, weight="weight", seed=0)
+
+        # NER graphs are mostly many small disconnected components, so lay each one out
+        # on its own with a short spring layout and tile them on a grid, largest first
+        components = sorted(
+            nx.weakly_connected_components(graph), key=len, reverse=True
+        )
+        columns = int(np.ceil(np.sqrt(len(components))))
+        positions: Dict[str, np.ndarray] = {}
+        for i, component in enumerate(components):
+            offset = 2.5 * np.array([i % columns, -(i // columns)])
+            if len(component) == 1:
+                component_positions = {node: np.zeros(2) for node in component}
+            else:
+                component_positions = nx.spring_layout(
+                    graph.subgraph(component), weight="weight", iterations=20, seed=0
+                )
+            for node, position in component_positions.items():
+                positions[node] = np.asarray(position) + offset
+
+        return positions
+
+    def visualise_graph(
+        self,
+        ner_graph: Union[NerGraph, dict, List[List[str]]],
+        layout: Optional[dict] = None,
+        max_edges: int = 200,
+        max_labels: int = 100,
+    ):
+        full_graph = self._load_ner_graph(ner_graph)
+        graph = full_graph.top_k(max_edges)
+        if layout is None or layout["graph_hash"] != graph.graph_hash():
+            layout = self.compute_layout(ner_graph=full_graph, max_edges=max_edges)
+        pos = dict(zip(layout["nodes"], layout["positions"]))
+        nx_graph = graph.to_networkx()
+
+        weights = np.array([weight for _, _, weight in nx_graph.edges(data="weight")])
+        widths = 0.5 + 2.5 * weights / weights.max() if len(weights) > 0 else 1.0
+        # Only label the most connected nodes, drawing every label is the slow part
+        labelled_nodes = sorted(
+            nx_graph.degree(weight="weight"), key=lambda x: x[1], reverse=True
+        )[:max_labels]
+
+        figure = plt.figure(figsize=(18, 12))
+        nx.draw_networkx_nodes(
+            nx_graph,
+            pos,
+            node_size=500 if nx_graph.number_of_nodes() <= max_labels else 50,
+            node_color="lightblue",
+        )
+        nx.draw_networkx_edges(
+            nx_graph, pos, arrows=True, edge_color="gray", width=widths
+        )
+        nx.draw_networkx_labels(
+            nx_graph,
+            pos,
+            labels={node: node for node, _ in labelled_nodes},
+            font_size=12,
+            font_color="black",
+        )
+        if nx_graph.number_of_edges() <= 50:
+            edge_labels = nx.get_edge_attributes(nx_graph, "label")
+            nx.draw_networkx_edge_labels(nx_graph, pos, edge_labels=edge_labels)
 
         plt.title("Dependency Graph")
         plt.axis("off")
         plt.show()
+        return figure
+
+    @staticmethod
+    def _load_ner_graph(ner_graph: Union[NerGraph, dict, List[List[str]]]) -> NerGraph:
+        if isinstance(ner_graph, NerGraph):
+            return ner_graph
+        if isinstance(ner_graph, dict):
+            return NerGraph.from_dict(ner_graph)
+        return NerGraph.from_triplets(ner_graph)
 
     def plot_dates(self, data: dict):
         df = self._parse_company_data(data)
@@ -1,7 +1,7 @@
 import json
 import time
 from pathlib import Path
-from typing import List, Union
+from typing import Dict, List, Union
 
 import openai
 
@@ -46,6 +46,56 @@ class ChatGPTWrapper:
 
         return response
 
+    def predict_packed(
+        self,
+        topic_titles: Dict[int, List[str]],
+        max_prompt_tokens: int = 2048,
+        max_retries: int = 2,
+    ) -> Dict[int, Union[str, None]]:
+        """
+        Summarise many topics using as few ChatGPT completions as possible.
+
+        Several topics are packed into a single "summary_packed" prompt, up to a token
+        budget, so the assistant prompt and few-shot example are only sent once per
+        request. The structured per-topic output is parsed back to the right topics and
+        only the topics whose parse failed are retried.
+
+        Args:
+            topic_titles (dict): Mapping of topic id to the titles of that topic.
+            max_prompt_tokens (int): Approximate token budget of a single packed prompt. Default is 2048.
+            max_retries (int): Maximum number of retries for topics whose output could not be parsed. Default is 2.
+
+        Returns:
+            dict: Mapping of topic id to the generated summary, or None if unsuccessful.
+        """
+        summaries: Dict[int, Union[str, None]] = {
+            topic: None for topic in topic_titles.keys()
+        }
+        pending = list(topic_titles.keys())
+
+        attempt = 0
+        while len(pending) > 0 and attempt <= max_retries:
+            failed: List[int] = []
+            for batch in self._pack_topics(
+                topic_titles={topic: topic_titles[topic] for topic in pending},
+                max_prompt_tokens=max_prompt_tokens,
+            ):
+                prompt = self._parse_packed_prompt(
+                    topic_titles={topic: topic_titles[topic] for topic in batch}
+                )
+                response = self.invoke_chatgpt(prompt=prompt)
+                parsed = self._parse_packed_response(response=response, topics=batch)
+                for topic in batch:
+                    if topic not in parsed:
+                        failed.append(topic)
+                    elif "<FAILED>" not in parsed[topic]:
+                        summaries[topic] = parsed[topic]
+
+            pending = failed
+            attempt += 1
+
+        return summaries
+
     def invoke_chatgpt(
         self, prompt: str, max_retries: int = 3, backoff_time: int = 2
     ) -> Union[str, None]:
@@ -115,6 +165,125 @@ class ChatGPTWrapper:
 
         return prompt
 
+    def _pack_topics(
+        self, topic_titles: Dict[int, List[str]], max_prompt_tokens: int
+    ) -> List[List[int]]:
+        """
+        Greedily group topics into batches whose packed prompt fits the token budget.
+
+        Args:
+            topic_titles (dict): Mapping of topic id to the titles of that topic.
+            max_prompt_tokens (int): Approximate token budget of a single packed prompt.
+
+        Returns:
+            list: List of batches, each a list of topic ids. A topic that exceeds the budget on its own gets its own batch.
+        """
+        budget = max_prompt_tokens - self._estimate_tokens(
+            self._assistant_prompt + self.prompt_templates["summary_packed"]
+        )
+
+        batches: List[List[int]] = []
+        current_batch: List[int] = []
+        current_tokens = 0
+        for topic, titles in topic_titles.items():
+            topic_tokens = self._estimate_tokens(
+                self._format_topic_block(topic=topic, titles=titles)
+            )
+            if len(current_batch) > 0 and current_tokens + topic_tokens > budget:
+                batches.append(current_batch)
+                current_batch, current_tokens = [], 0
+            current_batch.append(topic)
+            current_tokens += topic_tokens
+
+        if len(current_batch) > 0:
+            batches.append(current_batch)
+
+        return batches
+
+    def _parse_packed_prompt(self, topic_titles: Dict[int, List[str]]) -> str:
+        """
+        Parse the packed summary prompt for several topics at once.
+
+        Args:
+            topic_titles (dict): Mapping of topic id to the titles of that topic.
+
+        Returns:
+            str: The parsed prompt.
+        """
+        substring = ""
+        for topic, titles in topic_titles.items():
+            substring += self._format_topic_block(topic=topic, titles=titles)
+
+        return self.prompt_templates["summary_packed"].format(substring)
+
+    @staticmethod
+    def _parse_packed_response(
+        response: Union[str, None], topics: List[int]
+    ) -> Dict[int, str]:
+        """
+        Parse the structured output of a packed prompt back to its topics.
+
+        Args:
+            response (Union[str, None]): The raw ChatGPT response.
+            topics (list): The topic ids that were packed into the prompt.
+
+        Returns:
+            dict: Mapping of topic id to summary for every topic that parsed successfully.
+        """
+        if response is None or "{" not in response or "}" not in response:
+            return {}
+
+        try:
+            output = json.loads(
+                response[response.index("{") : response.rindex("}") + 1]
+            )
+        except json.JSONDecodeError:
+            return {}
+
+        if not isinstance(output, dict):
+            return {}
+
+        parsed: Dict[int, str] = {}
+        for topic in topics:
+            summary = output.get(str(topic))
+            if isinstance(summary, str) and len(summary.strip()) > 0:
+                parsed[topic] = summary.strip()
+
+        return parsed
+
+    @staticmethod
+    def _format_topic_block(topic: int, titles: List[str]) -> str:
+        """
+        Format the titles of a single topic as a block of the packed prompt.
+
+        Args:
+            topic (int): The topic id.
+            titles (list): List of titles of the topic.
+
+        Returns:
+            str: The formatted block.
+        """
+        # Handle nested lists
+        if len(titles) > 0 and isinstance(titles[0], list):
+            titles = titles[0]
+        block = f"Topic {topic} titles:"
+        for title in titles:
+            block += "\n" + title
+        return block + "\n"
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """
+        Roughly estimate the number of tokens in a piece of text (~4 characters per token).
+
+        Args:
+            text (str): The text to estimate.
+
+        Returns:
+            int: The estimated number of tokens.
+        """
+        return len(text) // 4 + 1
+
 
 if __name__ == "__main__":
     x = ChatGPTWrapper()
@@ -1,18 +1,478 @@
+import hashlib
+import json
+import sqlite3
 import sys
-from typing import List, Tuple
+import time
+import warnings
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
+import networkx as nx
+import numpy as np
 import spacy
 
 
+class NerGraph:
+    """
+    A compact, aggregated representation of a graph of verb triplets.
+
+    Entity and relation strings are interned to integer ids, and every unique
+    (head, relation, tail) edge is stored once in columnar numpy arrays together with
+    the number of times it was seen and the indices of the articles it was seen in.
+
+    Attributes:
+        entities (list): Interned entity strings, indexed by entity id.
+        relations (list): Interned relation strings, indexed by relation id.
+        heads (np.ndarray): Entity id of the head of each edge.
+        tails (np.ndarray): Entity id of the tail of each edge.
+        edge_relations (np.ndarray): Relation id of each edge.
+        counts (np.ndarray): Number of times each edge was seen.
+        article_offsets (np.ndarray): Offsets into article_indices, where the articles of edge i are article_indices[article_offsets[i]:article_offsets[i + 1]].
+        article_indices (np.ndarray): Sorted source article indices of all edges, concatenated.
+    """
+
+    def __init__(
+        self,
+        entities: List[str],
+        relations: List[str],
+        heads: np.ndarray,
+        tails: np.ndarray,
+        edge_relations: np.ndarray,
+        counts: np.ndarray,
+        article_offsets: np.ndarray,
+        article_indices: np.ndarray,
+    ):
+        self.entities = entities
+        self.relations = relations
+        self.heads = heads
+        self.tails = tails
+        self.edge_relations = edge_relations
+        self.counts = counts
+        self.article_offsets = article_offsets
+        self.article_indices = article_indices
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    @classmethod
+    def from_triplets(
+        cls,
+        triplets: List[Tuple[str, str, str]],
+        article_indices: Optional[List[int]] = None,
+    ) -> "NerGraph":
+        """
+        Aggregate a list of verb triplets into a NerGraph.
+
+        Args:
+            triplets (list): List of (subject, relation, object) triplets, repetitions included.
+            article_indices (list): Index of the source article of each triplet. Default is None, meaning every triplet is from article 0.
+
+        Returns:
+            NerGraph: The aggregated graph.
+        """
+        if article_indices is None:
+            article_indices = [0] * len(triplets)
+
+        entity_ids: Dict[str, int] = {}
+        relation_ids: Dict[str, int] = {}
+        edge_ids: Dict[Tuple[int, int, int], int] = {}
+        counts: List[int] = []
+        edge_articles: List[set] = []
+
+        for (subject, relation, object_), article in zip(triplets, article_indices):
+            key = (
+                entity_ids.setdefault(subject, len(entity_ids)),
+                relation_ids.setdefault(relation, len(relation_ids)),
+                entity_ids.setdefault(object_, len(entity_ids)),
+            )
+            edge = edge_ids.setdefault(key, len(edge_ids))
+            if edge == len(counts):
+                counts.append(0)
+                edge_articles.append(set())
+            counts[edge] += 1
+            edge_articles[edge].add(article)
+
+        keys = np.array(list(edge_ids.keys()), dtype=np.int32).reshape(-1, 3)
+        sorted_articles = [sorted(articles) for articles in edge_articles]
+
+        return cls(
+            entities=list(entity_ids.keys()),
+            relations=list(relation_ids.keys()),
+            heads=keys[:, 0],
+            tails=keys[:, 2],
+            edge_relations=keys[:, 1].astype(np.int16),
+            counts=np.array(counts, dtype=np.int32),
+            article_offsets=np.cumsum(
+                [0] + [len(articles) for articles in sorted_articles], dtype=np.int64
+            ),
+            article_indices=np.array(
+                [article for articles in sorted_articles for article in articles],
+                dtype=np.int32,
+            ),
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "NerGraph":
+        """
+        Rebuild a NerGraph from the output of to_dict.
+
+        Args:
+            data (dict): A serialised NerGraph.
+
+        Returns:
+            NerGraph: The rebuilt graph.
+        """
+        edges = data["edges"]
+        return cls(
+            entities=list(data["entities"]),
+            relations=list(data["relations"]),
+            heads=np.array(edges["head"], dtype=np.int32),
+            tails=np.array(edges["tail"], dtype=np.int32),
+            edge_relations=np.array(edges["relation"], dtype=np.int16),
+            counts=np.array(edges["count"], dtype=np.int32),
+            article_offsets=np.cumsum(
+                [0] + [len(articles) for articles in edges["articles"]], dtype=np.int64
+            ),
+            article_indices=np.array(
+                [article for articles in edges["articles"] for article in articles],
+                dtype=np.int32,
+            ),
+        )
+
+    def edge_articles(self, edge: int) -> np.ndarray:
+        """
+        Get the source article indices of a single edge.
+
+        Args:
+            edge (int): The edge index.
+
+        Returns:
+            np.ndarray: Sorted indices of the articles the edge was seen in.
+        """
+        return self.article_indices[
+            self.article_offsets[edge] : self.article_offsets[edge + 1]
+        ]
+
+    def graph_hash(self) -> str:
+        """
+        Get a stable hash of the entities and edges of the graph, e.g. to cache layouts.
+
+        Returns:
+            str: Hex digest identifying the graph structure and edge weights.
+        """
+        digest = hashlib.sha1("\x1f".join(self.entities).encode("utf-8"))
+        for array in (self.heads, self.tails, self.edge_relations, self.counts):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()
+
+    def top_k(self, k: int) -> "NerGraph":
+        """
+        Keep only the k edges with the highest weight, dropping unused entities.
+
+        Args:
+            k (int): Maximum number of edges to keep.
+
+        Returns:
+            NerGraph: A new graph with at most k edges, ordered by descending weight.
+        """
+        # Stable sort so ties keep their first-seen order
+        keep = np.argsort(-self.counts, kind="stable")[:k]
+        used_entities, inverse = np.unique(
+            np.concatenate([self.heads[keep], self.tails[keep]]), return_inverse=True
+        )
+        edge_articles = [self.edge_articles(edge) for edge in keep]
+
+        return NerGraph(
+            entities=[self.entities[entity] for entity in used_entities],
+            relations=list(self.relations),
+            heads=inverse[: len(keep)].astype(np.int32),
+            tails=inverse[len(keep) :].astype(np.int32),
+            edge_relations=self.edge_relations[keep],
+            counts=self.counts[keep],
+            article_offsets=np.cumsum(
+                [0] + [len(articles) for articles in edge_articles], dtype=np.int64
+            ),
+            article_indices=(
+                np.concatenate(edge_articles).astype(np.int32)
+                if len(edge_articles) > 0
+                else np.array([], dtype=np.int32)
+            ),
+        )
+
+    def to_edge_list(self) -> List[Tuple[str, str, str, int]]:
+        """
+        Convert the graph to a list of weighted edges.
+
+        Returns:
+            list: List of (subject, relation, object, count) tuples.
+        """
+        return [
+            (
+                self.entities[head],
+                self.relations[relation],
+                self.entities[tail],
+                int(count),
+            )
+            for head, relation, tail, count in zip(
+                self.heads, self.edge_relations, self.tails, self.counts
+            )
+        ]
+
+    def to_networkx(self) -> nx.DiGraph:
+        """
+        Convert the graph to a networkx DiGraph with label, weight and articles edge attributes.
+
+        Different relations between the same entities share a single edge, whose label
+        joins the relations, e.g. "nsubj/dobj".
+
+        Returns:
+            nx.DiGraph: The graph as a networkx DiGraph.
+        """
+        graph = nx.DiGraph()
+        for edge, (subject, relation, object_, count) in enumerate(
+            self.to_edge_list()
+        ):
+            if graph.has_edge(subject, object_):
+                attributes = graph[subject][object_]
+                if relation not in attributes["label"].split("/"):
+                    attributes["label"] += "/" + relation
+                attributes["weight"] += count
+                attributes["articles"] = sorted(
+                    set(attributes["articles"]) | set(self.edge_articles(edge).tolist())
+                )
+                continue
+            graph.add_edge(
+                subject,
+                object_,
+                label=relation,
+                weight=count,
+                articles=self.edge_articles(edge).tolist(),
+            )
+        return graph
+
+    def to_dict(self) -> dict:
+        """
+        Serialise the graph to a JSON compatible dictionary.
+
+        Returns:
+            dict: Dictionary with the interned entities and relations and the columnar edges.
+        """
+        return {
+            "entities": list(self.entities),
+            "relations": list(self.relations),
+            "edges": {
+                "head": self.heads.tolist(),
+                "tail": self.tails.tolist(),
+                "relation": self.edge_relations.tolist(),
+                "count": self.counts.tolist(),
+                "articles": [
+                    self.edge_articles(edge).tolist() for edge in range(len(self))
+                ],
+            },
+        }
+
+
+class TripletCache:
+    """
+    A size-bounded, on-disk cache of the verb triplets extracted from a text.
+
+    Entries are stored in a sqlite database keyed by a hash of the spaCy model name and
+    version, the entity types and the text. Each entry is charged its estimated size on
+    disk, and once the total exceeds max_bytes the least recently used entries are
+    evicted until it is back under low_water of max_bytes.
+
+    Attributes:
+        path (Path): Path of the sqlite database.
+        max_bytes (int): Maximum estimated size of the cache on disk in bytes.
+        low_water (float): Fraction of max_bytes the cache is evicted down to once full.
+        hits (int): Number of cache hits since the cache was created.
+        misses (int): Number of cache misses since the cache was created.
+    """
+
+    # Bytes sqlite spends on a row besides its key and value (row and index headers,
+    # the size and accessed columns, the accessed index entry and page slack)
+    ROW_OVERHEAD = 60
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        max_bytes: int = 256 * 1024**2,
+        low_water: float = 0.9,
+    ):
+        self.path = Path(path).expanduser()
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.hits: int = 0
+        self.misses: int = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(sqlite3.connect(self.path)) as connection, connection:
+            connection.executescript(
+                """
+                DROP TABLE IF EXISTS triplets;
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY, value TEXT, size INTEGER, accessed REAL
+                );
+                CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+                CREATE TABLE IF NOT EXISTS metadata (
+                    name TEXT PRIMARY KEY, value INTEGER
+                );
+                INSERT OR IGNORE INTO metadata VALUES ('total_size', 0);
+                CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries
+                BEGIN
+                    UPDATE metadata SET value = value + NEW.size
+                    WHERE name = 'total_size';
+                END;
+                CREATE TRIGGER IF NOT EXISTS entries_update
+                AFTER UPDATE OF size ON entries
+                BEGIN
+                    UPDATE metadata SET value = value + NEW.size - OLD.size
+                    WHERE name = 'total_size';
+                END;
+                CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries
+                BEGIN
+                    UPDATE metadata SET value = value - OLD.size
+                    WHERE name = 'total_size';
+                END;
+                """
+            )
+
+    @property
+    def total_size(self) -> int:
+        """
+        The estimated size of the cache on disk in bytes.
+        """
+        with closing(sqlite3.connect(self.path)) as connection:
+            return connection.execute(
+                "SELECT value FROM metadata WHERE name = 'total_size'"
+            ).fetchone()[0]
+
+    @property
+    def hit_ratio(self) -> float:
+        """
+        The fraction of lookups that were cache hits, or 0.0 if nothing was looked up.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    @staticmethod
+    def make_key(model: str, entity_types: List[str], text: str) -> str:
+        """
+        Build the cache key of a text.
+
+        Args:
+            model (str): The spaCy model name and version.
+            entity_types (list): List of entity types considered for triplets.
+            text (str): The text the triplets are extracted from.
+
+        Returns:
+            str: Hex digest identifying the model, entity types and text.
+        """
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return hashlib.sha256(
+            f"{model}|{','.join(sorted(entity_types))}|{text_hash}".encode("utf-8")
+        ).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[Tuple[str, str, str]]]:
+        """
+        Look up several keys at once, updating the hit statistics.
+
+        Args:
+            keys (list): List of cache keys.
+
+        Returns:
+            dict: Mapping of key to triplets for every key that was in the cache.
+        """
+        unique_keys = list(set(keys))
+        found: Dict[str, List[Tuple[str, str, str]]] = {}
+        with closing(sqlite3.connect(self.path)) as connection, connection:
+            # Stay well below sqlite's limit on the number of query parameters
+            for i in range(0, len(unique_keys), 500):
+                batch = unique_keys[i : i + 500]
+                rows = connection.execute(
+                    "SELECT key, value FROM entries WHERE key IN "
+                    f"({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, value in rows:
+                    found[key] = [tuple(triplet) for triplet in json.loads(value)]
+
+            connection.executemany(
+                "UPDATE entries SET accessed = ? WHERE key = ?",
+                [(time.time(), key) for key in found.keys()],
+            )
+
+        for key in keys:
+            if key in found:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return found
+
+    def put_many(self, entries: Dict[str, List[Tuple[str, str, str]]]) -> None:
+        """
+        Store several entries at once, then evict the least recently used entries
+        if the cache no longer fits max_bytes.
+
+        Args:
+            entries (dict): Mapping of key to the triplets to store.
+
+        Returns:
+            None
+        """
+        if len(entries) == 0:
+            return
+
+        rows = []
+        for key, triplets in entries.items():
+            value = json.dumps(triplets)
+            # The key is stored twice, in the table and in its primary key index
+            size = 2 * len(key) + len(value.encode("utf-8")) + self.ROW_OVERHEAD
+            rows.append((key, value, size, time.time()))
+
+        with closing(sqlite3.connect(self.path)) as connection, connection:
+            connection.executemany(
+                "INSERT INTO entries VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE "
+                "SET value = excluded.value, size = excluded.size, "
+                "accessed = excluded.accessed",
+                rows,
+            )
+            total_size = connection.execute(
+                "SELECT value FROM metadata WHERE name = 'total_size'"
+            ).fetchone()[0]
+            if total_size > self.max_bytes:
+                evicted = []
+                # Walk the accessed index oldest first, only as far as needed
+                for key, size in connection.execute(
+                    "SELECT key, size FROM entries ORDER BY accessed ASC"
+                ):
+                    if total_size <= self.max_bytes * self.low_water:
+                        break
+                    evicted.append((key,))
+                    total_size -= size
+                connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+
 class NerNetworkModel:
     """
     A class for extracting verb triplets using spaCy's named entity recognition (NER) model.
 
     Attributes:
         ner_model (spacy.Language): The loaded spaCy NER model.
+        cache (TripletCache): On-disk cache of the triplets of previously parsed texts, or None if disabled or unavailable.
+        verbose (bool): Whether to print the cache hit ratio after every extraction.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        cache_path: Optional[
+            Union[str, Path]
+        ] = "~/.cache/xapien_riskmodel/ner_triplets.sqlite",
+        max_cache_bytes: int = 256 * 1024**2,
+        verbose: bool = False,
+    ):
         if "en_core_web_sm" not in spacy.util.get_installed_models():
             try:
                 # Try to download the model
@@ -23,6 +483,16 @@ class NerNetworkModel:
                 sys.exit(1)
 
         self.ner_model = spacy.load("en_core_web_sm")
+        self._model_version = "{lang}_{name}-{version}".format(**self.ner_model.meta)
+        self.verbose = verbose
+        self.cache: Optional[TripletCache] = None
+        if cache_path is not None:
+            try:
+                self.cache = TripletCache(cache_path, max_bytes=max_cache_bytes)
+            except (OSError, sqlite3.Error) as e:
+                warnings.warn(
+                    f"NER parse cache disabled, could not open {cache_path}: {e}"
+                )
 
     def extract_verb_triplets(
         self,
@@ -39,10 +509,147 @@ class NerNetworkModel:
         Returns:
             list: List of verb triplets, where each triplet is a tuple of (subject, relation, object).
         """
+        return [
+            triplet
+            for _, triplet in self._iter_triplets(text=text, entity_types=entity_types)
+        ]
+
+    def extract_graph(
+        self,
+        text: List[str],
+        entity_types: List[str] = ["PERSON", "NORP", "FAC", "ORG", "EVENT", "LAW"],
+        top_k: Optional[int] = None,
+        article_ids: Optional[List[int]] = None,
+    ) -> NerGraph:
+        """
+        Extract an aggregated graph of verb triplets from the given list of sentences.
+
+        Args:
+            text (list): List of sentences.
+            entity_types (list): List of entity types to consider for triplets. Default is ["PERSON", "NORP", "FAC", "ORG", "EVENT", "LAW"].
+            top_k (int): If set, keep only the top_k edges by weight. Default is None.
+            article_ids (list): Id of the source article of each sentence. Default is None, meaning the position of the sentence in text.
+
+        Returns:
+            NerGraph: Aggregated graph whose edges carry counts and the ids of their source articles.
+        """
+        article_indices: List[int] = []
         triplets: List[Tuple[str, str, str]] = []
-        # Process the sentence with spaCy
-        for sentence in text:
-            doc = self.ner_model(sentence)
+        for i, triplet in self._iter_triplets(text=text, entity_types=entity_types):
+            article_indices.append(i if article_ids is None else article_ids[i])
+            triplets.append(triplet)
+
+        graph = NerGraph.from_triplets(triplets, article_indices=article_indices)
+        if top_k is not None:
+            graph = graph.top_k(top_k)
+
+        return graph
+
+    def _iter_triplets(
+        self, text: List[str], entity_types: List[str], batch_size: int = 64
+    ) -> Iterator[Tuple[int, Tuple[str, str, str]]]:
+        """
+        Iterate over the verb triplets of a list of sentences.
+
+        Only the unique sentences missing from the cache are parsed, in a single batch.
+
+        Args:
+            text (list): List of sentences.
+            entity_types (list): List of entity types to consider for triplets.
+            batch_size (int): Batch size used by spaCy to parse the cache misses. Default is 64.
+
+        Returns:
+            Iterator: Pairs of (sentence index, triplet).
+        """
+        text = list(text)
+        keys = [
+            TripletCache.make_key(self._model_version, entity_types, sentence)
+            for sentence in text
+        ]
+        cached = self._cache_get_many(keys)
+        misses = {
+            key: sentence for key, sentence in zip(keys, text) if key not in cached
+        }
+        new_entries: Dict[str, List[Tuple[str, str, str]]] = {}
+        if len(misses) > 0:
+            new_entries = dict(
+                zip(
+                    misses.keys(),
+                    self._parse_triplets(
+                        text=list(misses.values()),
+                        entity_types=entity_types,
+                        batch_size=batch_size,
+                    ),
+                )
+            )
+        if self.verbose and self.cache is not None:
+            hits = sum(key in cached for key in keys)
+            print(
+                f"NER parse cache hit ratio: {hits}/{len(keys)} this call, "
+                f"{self.cache.hit_ratio:.1%} overall"
+            )
+        parsed = [cached.get(key, new_entries.get(key)) for key in keys]
+        self._cache_put_many(new_entries)
+
+        for i, triplets in enumerate(parsed):
+            for triplet in triplets:
+                yield i, triplet
+
+    def _cache_get_many(self, keys: List[str]) -> Dict[str, List[Tuple[str, str, str]]]:
+        """
+        Look up keys in the cache, disabling it if it cannot be read.
+
+        Args:
+            keys (list): List of cache keys.
+
+        Returns:
+            dict: Mapping of key to triplets for every key that was in the cache.
+        """
+        if self.cache is None:
+            return {}
+        try:
+            return self.cache.get_many(keys)
+        except sqlite3.Error as e:
+            warnings.warn(f"NER parse cache disabled, could not read from it: {e}")
+            self.cache = None
+            return {}
+
+    def _cache_put_many(self, entries: Dict[str, List[Tuple[str, str, str]]]) -> None:
+        """
+        Store entries in the cache, disabling it if it cannot be written.
+
+        Args:
+            entries (dict): Mapping of key to the triplets to store.
+
+        Returns:
+            None
+        """
+        if self.cache is None:
+            return
+        try:
+            self.cache.put_many(entries)
+        except sqlite3.Error as e:
+            warnings.warn(f"NER parse cache disabled, could not write to it: {e}")
+            self.cache = None
+
+    def _parse_triplets(
+        self, text: List[str], entity_types: List[str], batch_size: int
+    ) -> List[List[Tuple[str, str, str]]]:
+        """
+        Parse a list of sentences with spaCy and extract the verb triplets of each.
+
+        Args:
+            text (list): List of sentences.
+            entity_types (list): List of entity types to consider for triplets.
+            batch_size (int): Batch size used by spaCy.
+
+        Returns:
+            list: The list of verb triplets of each sentence.
+        """
+        parsed: List[List[Tuple[str, str, str]]] = []
+        # Process the sentences with spaCy
+        for doc in self.ner_model.pipe(text, batch_size=batch_size):
+            triplets: List[Tuple[str, str, str]] = []
 
             # Extract dependency triplets involving specified entity types
             for token in doc:
@@ -52,5 +659,6 @@ class NerNetworkModel:
                         relation = token.dep_
                         object_ = token.text
                         triplets.append((subject, relation, object_))
+            parsed.append(triplets)
 
-        return triplets
+        return parsed
@@ -40,3 +40,43 @@ def test_parse_prompt_for_summary_task(chatgpt_wrapper):
     )
 
     assert prompt == expected_prompt
+
+
+def test_parse_packed_response_maps_summaries_to_topics(chatgpt_wrapper):
+    response = 'Answer: {"0": "summary of topic 0", "3": ""}'
+
+    parsed = chatgpt_wrapper._parse_packed_response(response, topics=[0, 3, 5])
+
+    assert parsed == {0: "summary of topic 0"}
+
+
+def test_pack_topics_respects_token_budget(chatgpt_wrapper):
+    topic_titles = {topic: ["title " * 50] for topic in range(10)}
+    base_tokens = chatgpt_wrapper._estimate_tokens(
+        chatgpt_wrapper._assistant_prompt
+        + chatgpt_wrapper.prompt_templates["summary_packed"]
+    )
+
+    batches = chatgpt_wrapper._pack_topics(topic_titles, base_tokens + 200)
+
+    assert sorted(topic for batch in batches for topic in batch) == list(range(10))
+    assert 1 < len(batches) < 10
+
+
+def test_predict_packed_retries_only_failed_topics(chatgpt_wrapper):
+    topic_titles = {0: ["title 1"], 1: ["title 2"], 2: ["title 3"]}
+    responses = [
+        '{"0": "summary 0", "2": "<FAILED>"}',
+        '{"1": "summary 1"}',
+    ]
+
+    with patch.object(
+        chatgpt_wrapper, "invoke_chatgpt", side_effect=responses
+    ) as invoke:
+        summaries = chatgpt_wrapper.predict_packed(topic_titles)
+
+    assert summaries == {0: "summary 0", 1: "summary 1", 2: None}
+    assert invoke.call_count == 2
+    retried_prompt = invoke.call_args.kwargs["prompt"].split("Your turn:")[-1]
+    assert "Topic 1 titles" in retried_prompt
+    assert "Topic 0 titles" not in retried_prompt
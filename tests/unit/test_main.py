@@ -0,0 +1,85 @@
+import os
+import sys
+from unittest.mock import patch
+
+import matplotlib.pyplot as plt
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+from src.main import RiskEngineBase
+from src.modelling.ner_graph import NerGraph
+
+
+@pytest.fixture
+def risk_engine():
+    # Skip loading the models, only the graph methods are tested
+    engine = RiskEngineBase.__new__(RiskEngineBase)
+    engine._layout_cache = {}
+    return engine
+
+
+@pytest.fixture
+def ner_graph():
+    triplets = [(f"verb {i}", "nsubj", f"entity {i}") for i in range(10)]
+    triplets += [("verb 0", "dobj", "entity 0")] * 5
+    return NerGraph.from_triplets(triplets)
+
+
+def test_compute_layout_is_cached_by_graph_hash(risk_engine, ner_graph):
+    with patch.object(
+        RiskEngineBase, "_layout_positions", wraps=RiskEngineBase._layout_positions
+    ) as layout_positions:
+        layout = risk_engine.compute_layout(ner_graph, max_edges=5)
+        cached_layout = risk_engine.compute_layout(ner_graph.to_dict(), max_edges=5)
+
+    assert layout_positions.call_count == 1
+    assert cached_layout is layout
+    assert layout["graph_hash"] == ner_graph.top_k(5).graph_hash()
+
+
+def test_compute_layout_nodes_match_pruned_graph(risk_engine, ner_graph):
+    layout = risk_engine.compute_layout(ner_graph, max_edges=5)
+
+    assert sorted(layout["nodes"]) == sorted(ner_graph.top_k(5).entities)
+    assert len(layout["positions"]) == len(layout["nodes"])
+
+
+def test_compute_layout_uses_components_layout_for_pruned_graphs(
+    risk_engine, ner_graph
+):
+    pruned_layout = risk_engine.compute_layout(ner_graph, max_edges=5)
+    full_layout = risk_engine.compute_layout(ner_graph, max_edges=len(ner_graph))
+
+    assert pruned_layout["layout"] == "components"
+    assert full_layout["layout"] == "spring"
+    # Disconnected components must not collapse onto the same position
+    positions = {tuple(position) for position in pruned_layout["positions"]}
+    assert len(positions) == len(pruned_layout["nodes"])
+
+
+def test_visualise_graph_reuses_matching_layout(risk_engine, ner_graph):
+    layout = risk_engine.compute_layout(ner_graph, max_edges=5)
+    risk_engine._layout_cache = {}
+
+    with patch.object(
+        risk_engine, "compute_layout", wraps=risk_engine.compute_layout
+    ) as compute_layout:
+        figure = risk_engine.visualise_graph(ner_graph, layout=layout, max_edges=5)
+    plt.close(figure)
+
+    compute_layout.assert_not_called()
+
+
+def test_visualise_graph_recomputes_stale_layout(risk_engine, ner_graph):
+    layout = risk_engine.compute_layout(ner_graph, max_edges=5)
+
+    with patch.object(
+        risk_engine, "compute_layout", wraps=risk_engine.compute_layout
+    ) as compute_layout:
+        figure = risk_engine.visualise_graph(ner_graph, layout=layout, max_edges=8)
+    plt.close(figure)
+
+    compute_layout.assert_called_once()
+    assert risk_engine._layout_cache[
+        f"{ner_graph.top_k(8).graph_hash()}-components"
+    ]["nodes"]
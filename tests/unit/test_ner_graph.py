@@ -0,0 +1,222 @@
+import os
+import sqlite3
+import sys
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+from src.modelling.ner_graph import NerGraph, NerNetworkModel, TripletCache
+
+
+@pytest.fixture
+def ner_graph():
+    triplets = [
+        ("jailed", "nsubj", "Elliott"),
+        ("jailed", "nsubj", "Elliott"),
+        ("sued", "dobj", "Niramax"),
+        ("jailed", "nsubj", "Elliott"),
+        ("fined", "dobj", "Niramax"),
+    ]
+    return NerGraph.from_triplets(triplets, article_indices=[0, 2, 1, 2, 3])
+
+
+class StubPipeline:
+    """
+    Stand-in for a spaCy pipeline, tagging every word as an ORG subject of "verb".
+    """
+
+    meta = {"lang": "en", "name": "core_web_sm", "version": "3.5.0"}
+
+    def __init__(self):
+        self.batches = []
+
+    def pipe(self, texts, batch_size):
+        self.batches.append(list(texts))
+        for text in self.batches[-1]:
+            yield [
+                SimpleNamespace(
+                    dep_="nsubj",
+                    ent_type_="ORG",
+                    text=word,
+                    head=SimpleNamespace(text="verb"),
+                )
+                for word in text.split()
+            ]
+
+
+def make_ner_network_model(**kwargs):
+    with patch("src.modelling.ner_graph.spacy") as spacy:
+        spacy.util.get_installed_models.return_value = ["en_core_web_sm"]
+        spacy.load.return_value = StubPipeline()
+        return NerNetworkModel(**kwargs)
+
+
+@pytest.fixture
+def ner_network_model():
+    return make_ner_network_model(cache_path=None)
+
+
+def test_from_triplets_aggregates_repeated_edges(ner_graph):
+    assert len(ner_graph) == 3
+    assert ner_graph.entities == ["jailed", "Elliott", "sued", "Niramax", "fined"]
+    assert ner_graph.to_edge_list()[0] == ("jailed", "nsubj", "Elliott", 3)
+    assert ner_graph.edge_articles(0).tolist() == [0, 2]
+
+
+def test_top_k_keeps_heaviest_edges_and_used_entities(ner_graph):
+    top_graph = ner_graph.top_k(2)
+
+    assert top_graph.to_edge_list() == [
+        ("jailed", "nsubj", "Elliott", 3),
+        ("sued", "dobj", "Niramax", 1),
+    ]
+    assert sorted(top_graph.entities) == ["Elliott", "Niramax", "jailed", "sued"]
+    assert top_graph.edge_articles(1).tolist() == [1]
+
+
+def test_to_dict_round_trips(ner_graph):
+    rebuilt = NerGraph.from_dict(ner_graph.to_dict())
+
+    assert rebuilt.to_edge_list() == ner_graph.to_edge_list()
+    assert rebuilt.to_dict() == ner_graph.to_dict()
+
+
+def test_to_networkx_sets_edge_weights(ner_graph):
+    graph = ner_graph.to_networkx()
+
+    assert graph["jailed"]["Elliott"]["weight"] == 3
+    assert graph["jailed"]["Elliott"]["label"] == "nsubj"
+    assert graph.number_of_edges() == 3
+
+
+def test_to_networkx_joins_relations_between_the_same_entities():
+    graph = NerGraph.from_triplets(
+        [("sued", "nsubj", "Niramax"), ("sued", "dobj", "Niramax")],
+        article_indices=[4, 7],
+    ).to_networkx()
+
+    assert graph.number_of_edges() == 1
+    assert graph["sued"]["Niramax"]["label"] == "nsubj/dobj"
+    assert graph["sued"]["Niramax"]["weight"] == 2
+    assert graph["sued"]["Niramax"]["articles"] == [4, 7]
+
+
+def test_graph_hash_identifies_entities_and_edges(ner_graph):
+    rebuilt = NerGraph.from_dict(ner_graph.to_dict())
+    renamed = NerGraph.from_dict(ner_graph.to_dict())
+    renamed.entities[0] = "convicted"
+
+    assert rebuilt.graph_hash() == ner_graph.graph_hash()
+    assert renamed.graph_hash() != ner_graph.graph_hash()
+    assert ner_graph.top_k(2).graph_hash() != ner_graph.graph_hash()
+    assert ner_graph.top_k(2).top_k(2).graph_hash() == ner_graph.top_k(2).graph_hash()
+
+
+def test_triplet_cache_round_trips_and_reports_hit_ratio(tmp_path):
+    cache = TripletCache(tmp_path / "cache.sqlite")
+    key = TripletCache.make_key("en_core_web_sm-3.5.0", ["ORG"], "Niramax was sued")
+
+    cache.put_many({key: [("sued", "nsubj", "Niramax")]})
+    found = cache.get_many([key, "missing"])
+
+    assert found == {key: [("sued", "nsubj", "Niramax")]}
+    assert cache.hit_ratio == 0.5
+
+
+def test_triplet_cache_key_depends_on_model_and_entity_types():
+    key = TripletCache.make_key("en_core_web_sm-3.5.0", ["ORG", "LAW"], "text")
+
+    assert key == TripletCache.make_key("en_core_web_sm-3.5.0", ["LAW", "ORG"], "text")
+    assert key != TripletCache.make_key("en_core_web_sm-3.6.0", ["ORG", "LAW"], "text")
+    assert key != TripletCache.make_key("en_core_web_sm-3.5.0", ["ORG"], "text")
+
+
+def test_triplet_cache_counts_keys_and_row_overhead(tmp_path):
+    cache = TripletCache(tmp_path / "cache.sqlite")
+    key = "k" * 64
+
+    cache.put_many({key: []})
+    assert cache.total_size == 2 * 64 + len("[]") + TripletCache.ROW_OVERHEAD
+
+    cache.put_many({key: [("sued", "nsubj", "Niramax")]})
+    cache.put_many({})
+    assert cache.total_size == 2 * 64 + 30 + TripletCache.ROW_OVERHEAD
+
+
+def test_triplet_cache_evicts_least_recently_used(tmp_path):
+    # Each entry is charged about 115 bytes, so the third one overflows the cache
+    cache = TripletCache(tmp_path / "cache.sqlite", max_bytes=300)
+
+    cache.put_many({"old": [("a" * 30, "nsubj", "b")]})
+    cache.put_many({"new": [("c" * 30, "nsubj", "d")]})
+    cache.put_many({"newest": [("e" * 30, "nsubj", "f")]})
+
+    assert set(cache.get_many(["old", "new", "newest"]).keys()) == {"new", "newest"}
+    assert cache.total_size <= 300 * cache.low_water
+
+
+def test_extract_graph_uses_article_ids(ner_network_model):
+    graph = ner_network_model.extract_graph(
+        ["Niramax", "Elliott Niramax"], entity_types=["ORG"], article_ids=[3, 8]
+    )
+
+    assert graph.to_edge_list() == [
+        ("verb", "nsubj", "Niramax", 2),
+        ("verb", "nsubj", "Elliott", 1),
+    ]
+    assert graph.edge_articles(0).tolist() == [3, 8]
+    assert graph.edge_articles(1).tolist() == [8]
+
+
+def test_extract_verb_triplets_only_parses_cache_misses(tmp_path, capsys):
+    model = make_ner_network_model(cache_path=tmp_path / "cache.sqlite", verbose=True)
+
+    first = model.extract_verb_triplets(["Niramax", "Elliott", "Niramax"], ["ORG"])
+    second = model.extract_verb_triplets(["Elliott", "Niramax"], ["ORG"])
+
+    assert first == [
+        ("verb", "nsubj", "Niramax"),
+        ("verb", "nsubj", "Elliott"),
+        ("verb", "nsubj", "Niramax"),
+    ]
+    assert second == [("verb", "nsubj", "Elliott"), ("verb", "nsubj", "Niramax")]
+    # One batch for the unique misses of the first call, nothing for the second
+    assert model.ner_model.batches == [["Niramax", "Elliott"]]
+    assert model.cache.hit_ratio == 2 / 5
+    assert "NER parse cache hit ratio: 2/2 this call" in capsys.readouterr().out
+
+
+def test_extract_verb_triplets_without_cache(ner_network_model, capsys):
+    triplets = ner_network_model.extract_verb_triplets(["Niramax", "Niramax"], ["ORG"])
+
+    assert triplets == [("verb", "nsubj", "Niramax"), ("verb", "nsubj", "Niramax")]
+    assert ner_network_model.ner_model.batches == [["Niramax"]]
+    assert capsys.readouterr().out == ""
+
+
+def test_unwritable_cache_path_disables_cache(tmp_path):
+    not_a_directory = tmp_path / "file"
+    not_a_directory.write_text("")
+
+    with pytest.warns(UserWarning, match="NER parse cache disabled"):
+        model = make_ner_network_model(cache_path=not_a_directory / "cache.sqlite")
+
+    assert model.cache is None
+    assert model.extract_verb_triplets(["Niramax"], ["ORG"]) == [
+        ("verb", "nsubj", "Niramax")
+    ]
+
+
+def test_unreadable_cache_disables_cache(tmp_path):
+    model = make_ner_network_model(cache_path=tmp_path / "cache.sqlite")
+
+    with patch.object(
+        model.cache, "get_many", side_effect=sqlite3.OperationalError("locked")
+    ), pytest.warns(UserWarning, match="could not read from it"):
+        triplets = model.extract_verb_triplets(["Niramax"], ["ORG"])
+
+    assert triplets == [("verb", "nsubj", "Niramax")]
+    assert model.ner_model.batches == [["Niramax"]]
+    assert model.cache is None